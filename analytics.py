@@ -0,0 +1,457 @@
+import argparse
+import json
+
+import numpy as np
+
+from config import chat
+
+HEADER = b'Timestamp,'
+CHUNK_SIZE = 16 * 1024 * 1024
+NEWLINE, COMMA, QUOTE = ord('\n'), ord(','), ord('"')
+EXIT = np.frombuffer(b'/exit', np.uint8)
+BAN = np.frombuffer(b'/ban ', np.uint8)
+HOURS = 24
+
+KIND_MESSAGE, KIND_EXIT, KIND_BAN = 0, 1, 2
+RAW, UNFINISHED = -1, -2  # результаты поиска закрывающей кавычки
+
+
+class BackupStats:
+    """
+    Накопитель агрегатов по истории сообщений.
+
+    Все массивы индексируются кодом пользователя, поэтому объем памяти
+    зависит от числа пользователей и сообщений в одном окне limit_time,
+    а не от размера истории. Окна считаются в предположении, что бэкап
+    дописывается в хронологическом порядке (так его пишет
+    Server.store_message).
+    """
+
+    def __init__(self, limit_time: int = chat.limit_time,
+                 limit_message: int = chat.limit_message):
+        self.limit_time = limit_time
+        self.limit_message = limit_message
+        self.codes: dict[bytes, int] = {}
+        self.names: list[str] = []
+        self.rows = 0
+        self.skipped = 0
+        self.first_time = np.inf
+        self.last_time = -np.inf
+        self.messages = np.zeros(0, np.int64)
+        self.private = np.zeros(0, np.int64)
+        self.exits = np.zeros(0, np.int64)
+        self.bans_sent = np.zeros(0, np.int64)
+        self.complaints = np.zeros(0, np.int64)
+        self.by_hour = np.zeros((0, HOURS), np.int64)
+        self.peak = np.zeros(0, np.int64)
+        self.limit_hits = np.zeros(0, np.int64)
+        self.last_count = np.zeros(0, np.int64)
+        self.recent: dict[int, np.ndarray] = {}
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        """
+        Переводит массив имен в коды пользователей.
+        Имена интернируются по уникальным значениям, а не построчно.
+        """
+        unique, inverse = np.unique(values, return_inverse=True)
+        mapping = np.empty(len(unique), np.int64)
+        for i, name in enumerate(unique):
+            code = self.codes.get(name)
+            if code is None:
+                code = self.codes[name] = len(self.names)
+                self.names.append(name.decode(errors='replace'))
+            mapping[i] = code
+        self._grow()
+        return mapping[inverse]
+
+    def _grow(self) -> None:
+        extra = len(self.names) - len(self.messages)
+        if extra <= 0:
+            return
+        for attr in ('messages', 'private', 'exits', 'bans_sent',
+                     'complaints', 'peak', 'limit_hits', 'last_count'):
+            setattr(self, attr, np.concatenate(
+                (getattr(self, attr), np.zeros(extra, np.int64))
+            ))
+        self.by_hour = np.vstack(
+            (self.by_hour, np.zeros((extra, HOURS), np.int64))
+        )
+
+    def add(self, timestamps: np.ndarray, senders: np.ndarray,
+            recipients: np.ndarray, kinds: np.ndarray,
+            targets: np.ndarray) -> None:
+        """
+        Учет одного блока строк, разобранного в колоночные массивы.
+        recipients и targets содержат -1 там, где получателя нет.
+        """
+        if not len(timestamps):
+            return
+        n = len(self.names)
+        self.rows += len(timestamps)
+        self.first_time = min(self.first_time, timestamps.min())
+        self.last_time = max(self.last_time, timestamps.max())
+
+        is_message = kinds == KIND_MESSAGE
+        is_ban = kinds == KIND_BAN
+        self.messages += np.bincount(senders[is_message], minlength=n)
+        self.private += np.bincount(
+            senders[is_message & (recipients >= 0)], minlength=n
+        )
+        self.exits += np.bincount(senders[kinds == KIND_EXIT], minlength=n)
+        self.bans_sent += np.bincount(senders[is_ban], minlength=n)
+        self.complaints += np.bincount(
+            targets[is_ban & (targets >= 0)], minlength=n
+        )
+
+        hours = (timestamps[is_message] // 3600 % HOURS).astype(np.int64)
+        self.by_hour += np.bincount(
+            senders[is_message] * HOURS + hours, minlength=n * HOURS
+        ).reshape(n, HOURS)
+
+        # ... как и в Server.wait_for_unblocking, /exit в лимит не входит
+        counted = kinds != KIND_EXIT
+        self._add_windows(senders[counted], timestamps[counted])
+
+    def _add_windows(self, senders: np.ndarray,
+                     timestamps: np.ndarray) -> None:
+        """
+        Скользящее окно limit_time секунд: для каждого сообщения
+        считается, сколько сообщений юзер отправил за limit_time секунд
+        до него включительно. limit_hits - сколько раз этот счетчик
+        дорастал до limit_message.
+
+        Между блоками для юзера переносятся (recent) только метки
+        времени, которые еще могут попасть в окно следующих сообщений.
+        """
+        if not len(senders):
+            return
+        order = np.argsort(senders, kind='stable')
+        users, first = np.unique(senders[order], return_index=True)
+        groups = np.split(timestamps[order], first[1:])
+        for user, times in zip(users, groups):
+            recent = self.recent.get(user, np.zeros(0))
+            times = np.concatenate((recent, np.sort(times)))
+            counts = np.arange(1, len(times) + 1) - np.searchsorted(
+                times, times - self.limit_time, side='right'
+            )
+            counts = counts[len(recent):]
+            previous = np.r_[self.last_count[user], counts[:-1]]
+            reached = (counts >= self.limit_message) & (
+                previous < self.limit_message
+            )
+            self.peak[user] = max(self.peak[user], counts.max())
+            self.limit_hits[user] += np.count_nonzero(reached)
+            self.last_count[user] = counts[-1]
+            self.recent[user] = times[times > times[-1] - self.limit_time]
+
+
+def parse_chunk(chunk: bytes, stats: BackupStats, final: bool = False,
+                max_record: int = CHUNK_SIZE) -> int:
+    """
+    Разбирает блок бэкапа (Timestamp, Sender, Recipient, Text)
+    в колоночные массивы и передает их в stats.
+
+    Разделители ищутся векторно по np.frombuffer, без списков строк.
+    Текст - последнее поле, поэтому запись режется по первым трем запятым:
+    запятые внутри сообщения не ломают разбор. Текст в кавычках
+    разбирается по правилам CSV: "" внутри и переводы строк допустимы.
+    Поля Timestamp, Sender и Recipient ожидаются без кавычек.
+
+    Возвращает число разобранных байт. Неполная последняя запись
+    (без перевода строки или с незакрытой кавычкой) остается вызывающему,
+    если только это не конец файла (final) и она короче max_record.
+    """
+    buf = np.frombuffer(chunk, np.uint8)
+    ends = np.flatnonzero(buf == NEWLINE)
+    consumed = int(ends[-1]) + 1 if len(ends) else 0
+    if final and consumed < len(buf):
+        ends = np.r_[ends, len(buf)]
+        consumed = len(buf)
+    if not len(ends):
+        return 0
+    starts = np.r_[0, ends[:-1] + 1]
+
+    commas = np.r_[np.flatnonzero(buf == COMMA), [len(buf) + 1] * 3]
+    first = np.searchsorted(commas, starts)
+    comma1, comma2, comma3 = (commas[first + k] for k in range(3))
+    valid = comma3 < ends
+    text_start = np.where(valid, comma3 + 1, ends)
+    quoted = valid & (text_start < ends)
+    quoted[quoted] = buf[text_start[quoted]] == QUOTE
+
+    alive, quoted_texts, cut = _merge_quoted(
+        chunk, (starts, ends, comma1, valid), text_start, quoted,
+        None if final else max_record
+    )
+    if cut is not None:
+        # ... запись продолжится в следующем блоке
+        consumed = cut
+
+    rows = np.flatnonzero(alive & valid)
+    stats.skipped += int((alive & ~valid & (ends - starts > 1)).sum())
+
+    timestamps = _to_float(_gather(buf, starts[rows], comma1[rows]))
+    correct = ~np.isnan(timestamps)
+    stats.skipped += int((~correct).sum())
+    rows, timestamps = rows[correct], timestamps[correct]
+
+    senders = stats.encode(_gather(buf, comma1[rows] + 1, comma2[rows]))
+    raw_recipients = _gather(buf, comma2[rows] + 1, comma3[rows])
+    is_private = raw_recipients != b'None'
+    recipients = np.full(len(rows), -1, np.int64)
+    recipients[is_private] = stats.encode(raw_recipients[is_private])
+
+    body = text_start[rows] + quoted[rows]
+    prefixes = _gather(buf, body, np.minimum(body + 5, ends[rows]))
+    prefixes = prefixes.astype('S5').view(np.uint8).reshape(-1, 5)
+    kinds = np.full(len(rows), KIND_MESSAGE, np.int8)
+    kinds[(prefixes == EXIT).all(axis=1)] = KIND_EXIT
+    is_ban = (prefixes == BAN).all(axis=1)
+    kinds[is_ban] = KIND_BAN
+
+    # ... Server.add_ban пишет юзера, на которого жалуются, в Recipient
+    targets = np.where(is_ban, recipients, -1)
+    names = {}
+    for j in np.flatnonzero(is_ban & (recipients < 0)):
+        i = rows[j]
+        words = quoted_texts.get(i, chunk[text_start[i]:ends[i]]).split()
+        if len(words) > 1:
+            names[j] = words[1]
+    if names:
+        targets[list(names)] = stats.encode(np.array(list(names.values())))
+
+    stats.add(timestamps, senders, recipients, kinds, targets)
+    return consumed
+
+
+def _merge_quoted(chunk: bytes, lines: tuple[np.ndarray, ...],
+                  text_start: np.ndarray, quoted: np.ndarray,
+                  max_record: int | None
+                  ) -> tuple[np.ndarray, dict[int, bytes], int | None]:
+    """
+    Склеивает строки, попавшие внутрь текста в кавычках, с записью,
+    которой они принадлежат: конец такой записи переносится в ends.
+
+    Server.store_message текст не экранирует, так что сообщение может
+    просто начинаться с ". Поле считается CSV-полем в кавычках, только
+    если закрывающая кавычка стоит в конце строки и до нее не началась
+    следующая запись; иначе это сырой текст и quoted сбрасывается.
+
+    max_record: незакрытую запись короче этого числа байт можно
+    перенести в следующий блок; None - блок последний, переносить некуда.
+
+    Возвращает маску строк, с которых начинаются записи, тексты
+    в кавычках (без экранирования) и начало переносимой записи (или None).
+    """
+    starts, ends = lines[:2]
+    alive = np.ones(len(starts), bool)
+    texts: dict[int, bytes] = {}
+    for i in np.flatnonzero(quoted):
+        if not alive[i]:
+            continue
+        last, closing = _quoted_end(chunk, lines, i, int(text_start[i]) + 1)
+        if (last == UNFINISHED and max_record is not None
+                and len(chunk) - starts[i] < max_record):
+            alive[i:] = False
+            return alive, texts, int(starts[i])
+        if last < 0:
+            quoted[i] = False
+            continue
+        texts[i] = chunk[text_start[i] + 1:closing].replace(b'""', b'"')
+        alive[i + 1:last + 1] = False
+        ends[i] = ends[last]
+    return alive, texts, None
+
+
+def _quoted_end(chunk: bytes, lines: tuple[np.ndarray, ...], line: int,
+                position: int) -> tuple[int, int]:
+    """
+    Ищет закрывающую кавычку поля, пропуская экранированные "".
+    Возвращает последнюю строку записи и позицию кавычки,
+    либо (RAW, -1) / (UNFINISHED, -1), если строки блока кончились.
+    """
+    starts, ends, comma1, valid = lines
+    while True:
+        end = int(ends[line])
+        quote = _unpaired_quote(chunk, position, end)
+        if quote != -1:
+            if chunk[quote + 1:end] in (b'', b'\r'):
+                return line, quote
+            return RAW, -1
+        line += 1
+        if line == len(starts):
+            return UNFINISHED, -1
+        timestamp = chunk[starts[line]:comma1[line]]
+        if valid[line] and not np.isnan(_parse_float(timestamp)):
+            # ... началась следующая запись бэкапа
+            return RAW, -1
+        position = int(starts[line])
+
+
+def _unpaired_quote(chunk: bytes, position: int, end: int) -> int:
+    while (quote := chunk.find(b'"', position, end)) != -1:
+        if quote + 1 == end or chunk[quote + 1] != QUOTE:
+            return quote
+        position = quote + 2
+    return -1
+
+
+def _gather(buf: np.ndarray, starts: np.ndarray,
+            stops: np.ndarray) -> np.ndarray:
+    """
+    Вырезает поля [starts, stops) из буфера в массив строк фиксированной
+    ширины (dtype S), по которому работают np.unique и astype.
+    """
+    lengths = stops - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    data = np.zeros((len(starts), width), np.uint8)
+    # ... по столбцам, чтобы не держать матрицу индексов int64
+    for offset in range(width):
+        inside = lengths > offset
+        data[inside, offset] = buf[starts[inside] + offset]
+    return data.view(f'S{width}').ravel()
+
+
+def _to_float(values: np.ndarray) -> np.ndarray:
+    """
+    Векторный перевод в float; нечисловые значения становятся nan.
+    """
+    try:
+        return values.astype(np.float64)
+    except ValueError:
+        return np.array([_parse_float(value) for value in values])
+
+
+def _parse_float(value: bytes) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def scan_backup(path: str, chunk_size: int = CHUNK_SIZE,
+                stats: BackupStats | None = None) -> BackupStats:
+    """
+    Читает бэкап блоками по chunk_size байт.
+    В памяти одновременно находится один блок, перенесенный хвост
+    не длиннее блока и массивы их разбора.
+    Запись длиннее блока пропускается.
+    """
+    stats = stats or BackupStats()
+    skipping = False
+    with open(path, 'rb') as file:
+        tail = file.readline(chunk_size)
+        if tail.startswith(HEADER):
+            tail = b''
+        while chunk := file.read(chunk_size):
+            if skipping:
+                newline = chunk.find(b'\n')
+                if newline == -1:
+                    continue
+                chunk, skipping = chunk[newline + 1:], False
+            chunk = tail + chunk
+            tail = chunk[parse_chunk(chunk, stats, max_record=chunk_size):]
+            if len(tail) > chunk_size:
+                # ... строка без перевода строки длиннее блока
+                stats.skipped += 1
+                tail, skipping = b'', True
+    if tail:
+        parse_chunk(tail, stats, final=True)
+    return stats
+
+
+def report(stats: BackupStats, top: int = 10,
+           threshold: float = 0.8) -> dict:
+    order = np.argsort(-stats.messages, kind='stable')[:top]
+    near = np.flatnonzero(stats.peak >= threshold * stats.limit_message)
+    near = near[np.argsort(-stats.peak[near], kind='stable')]
+    banned = np.flatnonzero((stats.bans_sent > 0) | (stats.complaints > 0))
+
+    def user(i: int) -> dict:
+        return {
+            'username': stats.names[i],
+            'messages': int(stats.messages[i]),
+            'private': int(stats.private[i]),
+            'sessions': int(stats.exits[i]),
+            'peak_per_window': int(stats.peak[i]),
+            'limit_hits': int(stats.limit_hits[i]),
+            'bans_sent': int(stats.bans_sent[i]),
+            'complaints': int(stats.complaints[i]),
+        }
+
+    return {
+        'rows': stats.rows,
+        'skipped': stats.skipped,
+        'first': float(stats.first_time) if stats.rows else None,
+        'last': float(stats.last_time) if stats.rows else None,
+        'limit_message': stats.limit_message,
+        'limit_time': stats.limit_time,
+        'top_talkers': [user(i) for i in order if stats.messages[i]],
+        'near_limit': [user(i) for i in near],
+        'bans': [user(i) for i in banned],
+        'by_hour': {
+            stats.names[i]: stats.by_hour[i].tolist()
+            for i in order if stats.messages[i]
+        },
+    }
+
+
+def render(result: dict) -> str:
+    lines = [
+        '======= BACKUP INFO: ========',
+        f'*\tROWS\t= {result["rows"]}',
+        f'*\tSKIPPED\t= {result["skipped"]}',
+        f'*\tLIMIT\t= {result["limit_message"]} messages '
+        f'per {result["limit_time"]}s',
+    ]
+    columns = (f'{"username":<20}{"msgs":>8}{"private":>9}{"sessions":>10}'
+               f'{"peak":>6}{"hits":>10}{"bans":>6}{"complaints":>12}')
+
+    def table(title: str, users: list[dict]) -> None:
+        lines.extend(['', f'======= {title}: ========', columns])
+        for u in users:
+            lines.append(
+                f'{u["username"]:<20}{u["messages"]:>8}{u["private"]:>9}'
+                f'{u["sessions"]:>10}{u["peak_per_window"]:>6}'
+                f'{u["limit_hits"]:>10}{u["bans_sent"]:>6}'
+                f'{u["complaints"]:>12}'
+            )
+
+    table('TOP TALKERS', result['top_talkers'])
+    table('NEAR LIMIT_MESSAGE', result['near_limit'])
+    table('/BAN USAGE', result['bans'])
+
+    hours = ''.join(f'{h:>5}' for h in range(HOURS))
+    lines.extend(['', '======= MESSAGES PER HOUR (UTC): ========',
+                  f'{"username":<20}{hours}'])
+    for name, counts in result['by_hour'].items():
+        lines.append(f'{name:<20}' + ''.join(f'{c:>5}' for c in counts))
+    return '\n'.join(lines)
+
+
+def positive(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError('must be a positive integer')
+    return number
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Offline analytics of the chat backup'
+    )
+    parser.add_argument('path', nargs='?', default=chat.backup_file)
+    parser.add_argument('--chunk-size', type=positive, default=16,
+                        help='read block size in MiB (default: 16)')
+    parser.add_argument('--top', type=positive, default=10)
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='share of limit_message treated as "near"')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    args = parser.parse_args()
+
+    result = report(
+        scan_backup(args.path, args.chunk_size * 1024 * 1024),
+        args.top, args.threshold
+    )
+    print(json.dumps(result, indent=2) if args.json else render(result))
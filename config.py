@@ -1,7 +1,7 @@
 import logging
 import sys
 from asyncio import StreamWriter
-from typing import TypedDict
+from typing import Literal, TypedDict
 
 from pydantic_settings import BaseSettings
 
@@ -19,6 +19,14 @@ class Settings(BaseSettings):
     limit_message: int = 20     # кол-во сообщений для 1 клиента за limit_time
     limit_time: int = 1 * 3600  # сколько (в сек) выделено для limit_message
     ban_time: int = 4 * 3600    # сколько времени (в секундах) идет блокировка
+    admins: list[str] = []      # юзеры, которым доступна команда /profile
+    profiling: bool = False     # включить профилирование при старте сервера
+    profile_dir: str = 'profile'  # куда сохраняются спаны и снимки
+    slow_callback_duration: float = 0.1  # порог (сек) медленного callback
+    profile_sampler: Literal['cprofile', 'tracemalloc'] | None = None
+    profile_sample_interval: int = 60    # период (сек) снятия снимков
+    profile_sample_duration: int = 5     # длительность (сек) сэмпла cProfile
+    profile_flush_interval: int = 5      # период (сек) записи спанов на диск
     rules: str = (
         'Be polite to other chat participants, otherwise,\n'
         'after three complaints, you will be banned for 4 hours.\n'
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+
+from config import chat
+from profiler import SPANS_FILE
+
+
+def load_spans(path: str) -> dict[str, dict[str, list]]:
+    """
+    Читает дамп спанов и группирует длительности и аллокации по фазам.
+    """
+    phases = defaultdict(lambda: {'durations': [], 'allocs': []})
+    with open(path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            span = json.loads(line)
+            phase = phases[span['phase']]
+            phase['durations'].append(span['duration'])
+            if span.get('alloc') is not None:
+                phase['allocs'].append(span['alloc'])
+    return phases
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def render(phases: dict[str, dict[str, list]]) -> str:
+    """
+    Таблицы по фазам: время (мс) и прирост памяти (КиБ).
+    Фазы вложены друг в друга, поэтому время считается включительно.
+    """
+    rows = sorted(
+        phases.items(), key=lambda item: sum(item[1]['durations']),
+        reverse=True
+    )
+    lines = [
+        '======= TIME PER PHASE (ms): ========',
+        f'{"phase":<22}{"calls":>8}{"total":>12}{"mean":>10}'
+        f'{"p95":>10}{"max":>10}',
+    ]
+    for name, data in rows:
+        durations = [d * 1000 for d in data['durations']]
+        lines.append(
+            f'{name:<22}{len(durations):>8}{sum(durations):>12.1f}'
+            f'{sum(durations) / len(durations):>10.2f}'
+            f'{percentile(durations, 0.95):>10.2f}{max(durations):>10.2f}'
+        )
+
+    lines += [
+        '',
+        '======= ALLOCATIONS PER PHASE (KiB): ========',
+        f'{"phase":<22}{"calls":>8}{"total":>12}{"mean":>10}{"max":>10}',
+    ]
+    for name, data in rows:
+        allocs = [a / 1024 for a in data['allocs']]
+        if not allocs:
+            continue
+        lines.append(
+            f'{name:<22}{len(allocs):>8}{sum(allocs):>12.1f}'
+            f'{sum(allocs) / len(allocs):>10.2f}{max(allocs):>10.2f}'
+        )
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Summary of server profiling spans'
+    )
+    parser.add_argument(
+        'path', nargs='?',
+        default=os.path.join(chat.profile_dir, SPANS_FILE),
+        help='span dump (default: <profile_dir>/spans.jsonl)'
+    )
+    args = parser.parse_args()
+    print(render(load_spans(args.path)))
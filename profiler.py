@@ -0,0 +1,208 @@
+import asyncio
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from asyncio import AbstractEventLoop
+from collections.abc import Awaitable, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import chat, logger
+
+SPANS_FILE = 'spans.jsonl'
+FLUSH_THRESHOLD = 1000  # сколько спанов копим в памяти до записи в файл
+
+
+class Profiler:
+    """
+    Опциональное профилирование сервера.
+
+    - Оборачивает фазы Server в спаны (время и прирост памяти)
+    - Включает debug-режим asyncio с отчетом о медленных callback
+    - По желанию периодически снимает cProfile или tracemalloc снимки
+
+    Включается настройкой profiling, командой /profile или сигналом SIGUSR1.
+    Запись на диск идет в отдельном потоке, чтобы не блокировать цикл.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.loop: AbstractEventLoop | None = None
+        self._spans: list[dict] = []
+        self._tasks: list[asyncio.Task] = []
+        self._own_tracemalloc = False
+        self._samples = 0
+        # ... один поток - записи в файл спанов не перемешиваются
+        self._writer = ThreadPoolExecutor(max_workers=1)
+
+    def attach(self, loop: AbstractEventLoop) -> None:
+        """
+        Привязка к циклу событий сервера.
+        """
+        self.loop = loop
+        if chat.profiling:
+            self.enable()
+
+    def enable(self) -> None:
+        if self.enabled or self.loop is None:
+            return
+        os.makedirs(chat.profile_dir, exist_ok=True)
+        self.loop.set_debug(True)
+        self.loop.slow_callback_duration = chat.slow_callback_duration
+        if (chat.profile_sampler == 'tracemalloc'
+                and not tracemalloc.is_tracing()):
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        self._tasks.append(self.loop.create_task(self._flush_periodically()))
+        if chat.profile_sampler:
+            self._tasks.append(self.loop.create_task(self._sample()))
+        self.enabled = True
+        logger.info('Profiling enabled (sampler: %s)', chat.profile_sampler)
+
+    def disable(self) -> None:
+        if not self.enabled:
+            return
+        self.enabled = False
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+            self._own_tracemalloc = False
+        self.loop.set_debug(False)
+        self.flush()
+        logger.info('Profiling disabled')
+
+    def toggle(self) -> None:
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def status(self) -> str:
+        self.flush()
+        state = 'on' if self.enabled else 'off'
+        return (
+            f'Profiling is {state}. '
+            f'Slow callback threshold: {chat.slow_callback_duration}s. '
+            f'Sampler: {chat.profile_sampler}. '
+            f'Output: {chat.profile_dir}\n'
+        )
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        Замер участка кода при включенном профилировании.
+        Прирост памяти пишется, только если запущен tracemalloc.
+        """
+        if not self.enabled:
+            yield
+            return
+        tracing = tracemalloc.is_tracing()
+        memory = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            alloc = None
+            if tracing and tracemalloc.is_tracing():
+                alloc = tracemalloc.get_traced_memory()[0] - memory
+            self._record(name, duration, alloc)
+
+    def phase(self, name: str) -> Callable:
+        """
+        Декоратор для корутин: каждый вызов сохраняется как спан.
+        """
+        def decorator(func: Callable[..., Awaitable]) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _record(self, name: str, duration: float, alloc: int | None) -> None:
+        self._spans.append({
+            'phase': name,
+            'timestamp': time.time(),
+            'duration': duration,
+            'alloc': alloc,
+        })
+        if len(self._spans) >= FLUSH_THRESHOLD:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Отдает накопленные спаны потоку записи в profile_dir/spans.jsonl.
+        """
+        if not self._spans:
+            return
+        spans, self._spans = self._spans, []
+        self._writer.submit(self._write_spans, spans)
+
+    @staticmethod
+    def _write_spans(spans: list[dict]) -> None:
+        os.makedirs(chat.profile_dir, exist_ok=True)
+        path = os.path.join(chat.profile_dir, SPANS_FILE)
+        with open(path, 'a') as file:
+            file.writelines(json.dumps(span) + '\n' for span in spans)
+
+    async def _flush_periodically(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(chat.profile_flush_interval)
+                self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    def _snapshot_path(self, kind: str, extension: str) -> str:
+        self._samples += 1
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        millis = int(time.time() * 1000) % 1000
+        name = f'{kind}-{stamp}.{millis:03d}-{self._samples}.{extension}'
+        return os.path.join(chat.profile_dir, name)
+
+    async def _sample(self) -> None:
+        """
+        Периодическое снятие снимков в profile_dir:
+          - cprofile: профиль всего потока за profile_sample_duration секунд
+          - tracemalloc: снимок распределения памяти
+        """
+        try:
+            while True:
+                await asyncio.sleep(chat.profile_sample_interval)
+                try:
+                    path = await self._take_sample()
+                except Exception:
+                    # ... например, поверх сервера уже запущен другой профайлер
+                    logger.exception('Profile snapshot failed')
+                    continue
+                logger.debug('Profile snapshot saved to %s', path)
+        except asyncio.CancelledError:
+            pass
+
+    async def _take_sample(self) -> str:
+        if chat.profile_sampler == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await asyncio.sleep(chat.profile_sample_duration)
+            finally:
+                profile.disable()
+            path = self._snapshot_path('cprofile', 'prof')
+            await self.loop.run_in_executor(
+                self._writer, profile.dump_stats, path
+            )
+        else:
+            path = self._snapshot_path('tracemalloc', 'snapshot')
+            await self.loop.run_in_executor(
+                self._writer, lambda: tracemalloc.take_snapshot().dump(path)
+            )
+        return path
+
+
+profiler = Profiler()
@@ -1,12 +1,14 @@
 import asyncio
 import json
 import os
+import signal
 import time
 from asyncio import StreamReader
 
 import aiofiles
 
 from config import *
+from profiler import profiler
 
 user_stats = dict(dict())
 
@@ -22,6 +24,13 @@ class Server:
         c последующей их обработкой методом client_connected
         """
         logger.info('Start server')
+        loop = asyncio.get_running_loop()
+        profiler.attach(loop)
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, profiler.toggle)
+        except (AttributeError, NotImplementedError):
+            # ... на Windows профилирование включается только командой
+            pass
         server = await asyncio.start_server(
             self.client_connected, chat.host, chat.port
         )
@@ -30,6 +39,8 @@ class Server:
                 await server.serve_forever()
         except asyncio.CancelledError:
             logger.info('Server shutting down...')
+        finally:
+            profiler.disable()
 
     async def client_connected(
             self, reader: StreamReader, writer: StreamWriter
@@ -72,21 +83,26 @@ class Server:
                 writer,
                 reader
             )
-            is_new_user = username not in user_stats
-            if is_new_user:
-                user_stats[username] = {
-                    'counter_message': 0,
-                    'ban': False,
-                    'complains': set(),
-                    'start_timeout': None,
-                    'finish_timeout': None,
-                    'password': password,
-                    'writers': [writer]
-                }
-
-            fact_password = user_stats.get(username)['password']
-            if fact_password == password:
-                await self.remove_old_messages()
+            # ... ввод логина и пароля клиентом в замер не входит
+            with profiler.span('auth'):
+                is_new_user = username not in user_stats
+                if is_new_user:
+                    user_stats[username] = {
+                        'counter_message': 0,
+                        'ban': False,
+                        'complains': set(),
+                        'start_timeout': None,
+                        'finish_timeout': None,
+                        'password': password,
+                        'writers': [writer]
+                    }
+
+                fact_password = user_stats.get(username)['password']
+                is_authorized = fact_password == password
+                if is_authorized:
+                    await self.remove_old_messages()
+
+            if is_authorized:
                 welcome_message = f'\nWelcome to chat, {username}!\n'
                 await Server.write_to_chat(writer, welcome_message)
 
@@ -132,6 +148,7 @@ class Server:
             # ... когда пользователь закрыл терминал, не предоставив данные
             return '', ''
 
+    @profiler.phase('restore')
     async def restore_messages(
             self, writer: StreamWriter, is_new_user: bool
     ) -> None:
@@ -217,6 +234,9 @@ class Server:
             sender = msg[1]
             recipient = msg[2]
             text = msg[3]
+            if text.startswith('/ban'):
+                # ... жалобы хранятся только для статистики
+                continue
 
             text_to_restore = ''
             if username == sender and recipient == 'None':
@@ -277,6 +297,10 @@ class Server:
                 await writer.drain()
                 continue
 
+            if message.startswith('/profile'):
+                await self.switch_profiling(writer, username, message)
+                continue
+
             try:
                 if not await Server.wait_for_unblocking(username):
                     if message.startswith('/ban'):
@@ -308,6 +332,9 @@ class Server:
         имя отправителя жалобы.
         Проверяется количество жалоб, и в случае превышения
         пользователь блокируется.
+
+        Жалоба сохраняется в бэкап-файле с получателем - тем, на кого
+        жалуются, поэтому в общую историю она не попадает.
         """
         writers = user_stats[sender]['writers']
         banned = message.split()[1]
@@ -315,6 +342,7 @@ class Server:
             text = f'Ban error: check username'
             await Server.write_to_chat(writers, text)
             return
+        await Server.store_message(sender, message, banned)
         banned_writers = user_stats[banned]['writers']
         old_count_bans = len(user_stats[banned]['complains'])
         user_stats[banned]['complains'].add(sender)
@@ -357,17 +385,20 @@ class Server:
             user_stats[username]['complains'] = set()
         else:
             if user_stats[username]['counter_message'] == chat.limit_message:
-                async with aiofiles.open(chat.backup_file, 'r') as file:
-                    messages = await file.readlines()
-                counter = 0
-                time_0: float = 0
-                for i in reversed(messages):
-                    msg = i.split(',')
-                    if msg[1] == username and not msg[3].startswith('/exit'):
-                        if counter == chat.limit_message:
-                            time_0 = float(msg[0])
-                            break
-                        counter += 1
+                # ... само ожидание конца периода в замер не входит
+                with profiler.span('rate_limit'):
+                    async with aiofiles.open(chat.backup_file, 'r') as file:
+                        messages = await file.readlines()
+                    counter = 0
+                    time_0: float = 0
+                    for i in reversed(messages):
+                        msg = i.split(',')
+                        if (msg[1] == username
+                                and not msg[3].startswith('/exit')):
+                            if counter == chat.limit_message:
+                                time_0 = float(msg[0])
+                                break
+                            counter += 1
                 if time_0 + chat.limit_message > time.time():
                     timeout = time_0 + chat.limit_message - time.time()
                     t = time.strftime('%H:%M:%S', time.gmtime(timeout))
@@ -459,6 +490,30 @@ class Server:
         await Server.write_to_chat(writer, status)
 
     @staticmethod
+    async def switch_profiling(
+            writer: StreamWriter, username: str, message: str
+    ) -> None:
+        """
+        Админская команда управления профилированием:
+        /profile on | off | status
+        """
+        if username not in chat.admins:
+            await Server.write_to_chat(writer, 'Only for admins\n')
+            return
+        command = message.split()[1:2]
+        if command == ['on']:
+            profiler.enable()
+        elif command == ['off']:
+            profiler.disable()
+        elif command not in ([], ['status']):
+            await Server.write_to_chat(
+                writer, 'Template: /profile on | off | status\n'
+            )
+            return
+        await Server.write_to_chat(writer, profiler.status())
+
+    @staticmethod
+    @profiler.phase('fan_out')
     async def send_private(sender_writer: StreamWriter,  message: str) -> None:
         """
         Отправка приватных сообщений, если получатель -
@@ -499,6 +554,7 @@ class Server:
             )
             await Server.write_to_chat(sender_writers, error_message)
 
+    @profiler.phase('fan_out')
     async def send_general(self, writer: StreamWriter, sender: str, text: str) -> None:
         """
         Отправка сообщений в общий чат.
@@ -517,6 +573,7 @@ class Server:
 
 
     @staticmethod
+    @profiler.phase('file_io')
     async def store_message(
             sender: user, text: str, recipient: user = None
     ) -> None:
@@ -532,6 +589,7 @@ class Server:
         pass
 
     @staticmethod
+    @profiler.phase('remove_old_messages')
     async def remove_old_messages():
         async with aiofiles.open(chat.backup_file, 'r') as file:
             print('Removing old messages')
@@ -0,0 +1,141 @@
+import csv
+
+import pytest
+
+import analytics
+from analytics import BackupStats, report, scan_backup
+
+HEADER = 'Timestamp,Sender,Recipient,Text\n'
+LIMIT_TIME = 3600
+LIMIT_MESSAGE = 3
+
+
+def write_backup(path, rows):
+    with open(path, 'w', newline='') as file:
+        file.write(HEADER)
+        for timestamp, sender, recipient, text in rows:
+            file.write(f'{timestamp},{sender},{recipient},{text}\n')
+
+
+def scan(path, chunk_size, limit_message=LIMIT_MESSAGE):
+    stats = BackupStats(LIMIT_TIME, limit_message)
+    return scan_backup(str(path), chunk_size, stats)
+
+
+def user(stats, name):
+    result = report(stats, top=100)
+    return next(u for u in result['top_talkers'] + result['bans']
+                if u['username'] == name)
+
+
+@pytest.fixture
+def backup(tmp_path):
+    """
+    alice: 3 строки за первый час (включая /ban), затем 1, затем 4 -
+    лимит в 3 строки за час достигнут дважды
+    bob: 2 сообщения и /exit, который в лимит не входит
+    """
+    rows = [
+        (10.0, 'alice', 'None', 'hi, all'),
+        (20.0, 'bob', 'None', 'hello'),
+        (30.0, 'alice', 'bob', 'private, with commas'),
+        (40.0, 'alice', 'None', '/ban bob'),
+        (50.0, 'bob', 'None', 'bye'),
+        (60.0, 'bob', 'None', '/exit'),
+        (3700.0, 'alice', 'None', 'second window'),
+        (7300.0, 'alice', 'None', 'a'),
+        (7400.0, 'alice', 'None', 'b'),
+        (7500.0, 'alice', 'None', 'c'),
+        (7600.0, 'alice', 'None', 'd'),
+    ]
+    path = tmp_path / 'backup.csv'
+    write_backup(path, rows)
+    return path
+
+
+def test_windows(backup):
+    stats = scan(backup, 1024 * 1024)
+    alice, bob = user(stats, 'alice'), user(stats, 'bob')
+    assert (alice['peak_per_window'], alice['limit_hits']) == (4, 2)
+    assert (bob['peak_per_window'], bob['limit_hits']) == (2, 0)
+    assert (alice['messages'], alice['private']) == (7, 1)
+    assert (bob['messages'], bob['sessions']) == (2, 1)
+    assert (alice['bans_sent'], bob['complaints']) == (1, 1)
+    assert stats.skipped == 0
+
+
+@pytest.mark.parametrize('chunk_size', [48, 61, 100, 4096])
+def test_chunk_size_does_not_change_report(backup, chunk_size):
+    assert report(scan(backup, chunk_size)) == report(
+        scan(backup, 1024 * 1024)
+    )
+
+
+@pytest.mark.parametrize('chunk_size', [64, 77, 128, 4096])
+def test_quoted_csv(tmp_path, chunk_size):
+    path = tmp_path / 'backup.csv'
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['Timestamp', 'Sender', 'Recipient', 'Text'])
+        writer.writerow([10.0, 'alice', 'None', 'line1\nline2'])
+        writer.writerow([20.0, 'alice', 'None', 'say "hi", then\n"bye"'])
+        writer.writerow([30.0, 'bob', 'None', 'plain'])
+        writer.writerow([40.0, 'bob', 'alice', '/ban alice'])
+        writer.writerow([50.0, 'alice', 'None', '"/exit'])
+    stats = scan(path, chunk_size)
+    alice, bob = user(stats, 'alice'), user(stats, 'bob')
+    assert stats.rows == 5
+    assert stats.skipped == 0
+    assert (alice['messages'], alice['complaints']) == (3, 1)
+    assert (bob['messages'], bob['bans_sent']) == (1, 1)
+
+
+def test_window_is_rolling(tmp_path):
+    path = tmp_path / 'backup.csv'
+    write_backup(path, [(3590.0 + i, 'alice', 'None', 'spam')
+                        for i in range(20)])
+    stats = scan(path, 64, limit_message=20)
+    alice = user(stats, 'alice')
+    assert (alice['peak_per_window'], alice['limit_hits']) == (20, 1)
+    assert [u['username'] for u in report(stats)['near_limit']] == ['alice']
+
+
+@pytest.mark.parametrize('chunk_size', [64, 4096, 1024 * 1024])
+def test_unclosed_leading_quote_is_raw_text(tmp_path, chunk_size):
+    path = tmp_path / 'backup.csv'
+    rows = [(10.0, 'alice', 'None', '"hello')]
+    rows += [(20.0 + i, 'bob', 'None', f'message {i}') for i in range(1000)]
+    rows += [(2000.0, 'bob', 'None', 'he said "hi"')]
+    write_backup(path, rows)
+    stats = scan(path, chunk_size)
+    assert (stats.rows, stats.skipped) == (1002, 0)
+    assert user(stats, 'alice')['messages'] == 1
+    assert user(stats, 'bob')['messages'] == 1001
+
+
+def test_carried_tail_is_bounded(tmp_path, monkeypatch):
+    chunk_size = 64
+    sizes = []
+    parse_chunk = analytics.parse_chunk
+
+    def spy(chunk, *args, **kwargs):
+        sizes.append(len(chunk))
+        return parse_chunk(chunk, *args, **kwargs)
+
+    monkeypatch.setattr(analytics, 'parse_chunk', spy)
+    path = tmp_path / 'backup.csv'
+    rows = [(10.0, 'alice', 'None', '"' + 'x' * 10 * chunk_size)]
+    rows += [(20.0 + i, 'bob', 'None', 'hi') for i in range(100)]
+    write_backup(path, rows)
+    stats = scan(path, chunk_size)
+    assert max(sizes) <= 2 * chunk_size
+    assert (stats.rows, stats.skipped) == (100, 1)
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    path = tmp_path / 'backup.csv'
+    path.write_text(HEADER + 'garbage\nnot-a-time,a,None,x\n'
+                    '10.0,alice,None,"never closed\n')
+    stats = scan(path, 64)
+    assert stats.rows == 1
+    assert stats.skipped == 2
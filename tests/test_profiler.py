@@ -0,0 +1,140 @@
+import asyncio
+import cProfile
+import json
+import threading
+import tracemalloc
+
+import pytest
+
+import profile_report
+from config import chat
+from profiler import SPANS_FILE, Profiler
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat, 'profile_dir', str(tmp_path))
+    monkeypatch.setattr(chat, 'profile_sampler', None)
+    return tmp_path
+
+
+def run_enabled(profiler, body):
+    async def main():
+        profiler.attach(asyncio.get_running_loop())
+        profiler.enable()
+        try:
+            await body()
+        finally:
+            profiler.disable()
+    asyncio.run(main())
+
+
+def read_spans(profiler, profile_dir):
+    profiler._writer.shutdown(wait=True)
+    with open(profile_dir / SPANS_FILE) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_span_is_not_recorded_when_disabled(profile_dir):
+    profiler = Profiler()
+    with profiler.span('auth'):
+        pass
+    assert profiler._spans == []
+
+
+def test_span_without_tracemalloc(profile_dir):
+    profiler = Profiler()
+
+    async def body():
+        with profiler.span('auth'):
+            await asyncio.sleep(0)
+        assert [span['phase'] for span in profiler._spans] == ['auth']
+
+    assert not tracemalloc.is_tracing()
+    run_enabled(profiler, body)
+    [span] = read_spans(profiler, profile_dir)
+    assert span['alloc'] is None
+    assert span['duration'] >= 0
+
+
+def test_span_with_tracemalloc(profile_dir):
+    profiler = Profiler()
+    kept = []
+
+    async def body():
+        with profiler.span('restore'):
+            kept.append([0] * 100_000)
+
+    tracemalloc.start()
+    try:
+        run_enabled(profiler, body)
+    finally:
+        tracemalloc.stop()
+    [span] = read_spans(profiler, profile_dir)
+    assert span['alloc'] > 0
+
+
+def test_flush_writes_in_writer_thread(profile_dir, monkeypatch):
+    threads = []
+    write_spans = Profiler._write_spans
+
+    def spy(spans):
+        threads.append(threading.current_thread())
+        write_spans(spans)
+
+    monkeypatch.setattr(Profiler, '_write_spans', staticmethod(spy))
+    profiler = Profiler()
+    profiler._record('fan_out', 0.5, None)
+    profiler._record('file_io', 0.25, 128)
+    profiler.flush()
+    assert profiler._spans == []
+
+    spans = read_spans(profiler, profile_dir)
+    assert [span['phase'] for span in spans] == ['fan_out', 'file_io']
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_sampler_survives_errors(profile_dir, monkeypatch):
+    monkeypatch.setattr(chat, 'profile_sampler', 'cprofile')
+    monkeypatch.setattr(chat, 'profile_sample_interval', 0)
+    monkeypatch.setattr(chat, 'profile_sample_duration', 0)
+    calls = []
+
+    def enable(self):
+        calls.append(self)
+        raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(cProfile.Profile, 'enable', enable)
+    profiler = Profiler()
+
+    async def body():
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert not any(task.done() for task in profiler._tasks)
+
+    run_enabled(profiler, body)
+    assert len(calls) > 1
+
+
+def test_report(tmp_path):
+    path = tmp_path / SPANS_FILE
+    spans = [
+        {'phase': 'auth', 'duration': 0.002, 'alloc': 2048},
+        {'phase': 'auth', 'duration': 0.004, 'alloc': 1024},
+        {'phase': 'fan_out', 'duration': 0.010, 'alloc': None},
+    ]
+    path.write_text(''.join(json.dumps(span) + '\n' for span in spans))
+
+    phases = profile_report.load_spans(str(path))
+    assert phases['auth'] == {'durations': [0.002, 0.004],
+                              'allocs': [2048, 1024]}
+    assert phases['fan_out'] == {'durations': [0.010], 'allocs': []}
+
+    time_table, alloc_table = profile_report.render(phases).split('\n\n')
+    rows = time_table.splitlines()[2:]
+    assert rows[0].split()[:3] == ['fan_out', '1', '10.0']
+    assert rows[1].split()[:3] == ['auth', '2', '6.0']
+    assert [row.split()[0] for row in alloc_table.splitlines()[2:]] == [
+        'auth'
+    ]
+    assert alloc_table.splitlines()[2].split()[1:3] == ['2', '3.0']